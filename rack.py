@@ -10,8 +10,9 @@ Commands:
   rack add <hash> key=value ...
   rack burn [-h <hash1> [hash2...]]   # no flags deletes entire .rack
   rack info <hash>
-  rack dump <hash> [-o <output_path>] [-rm]
+  rack dump <hash> [path-glob ...] [-o <output_path>] [-rm]
   rack config
+  rack train [-p path]    # train a zstd dictionary for small log files
 """
 import os
 import sys
@@ -19,23 +20,44 @@ import hashlib
 import json
 import tarfile
 import fnmatch
+import re
 import shutil
-import tempfile, select
-from datetime import datetime
+import random
+import functools
+import threading
+import time
+import stat
+import select
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # optional import check
 try:
     import zstandard as zstd
 except Exception:
     sys.exit("Error: 'zstandard' module not found. Install with: pip install zstandard")
+try:
+    import orjson  # faster index/config parsing when available
+except ImportError:
+    orjson = None
 
 DEFAULT_CONFIG = {
     "input_dir": "logs-debug",
     "exclude": ["*.tmp", "./debug/*"],
     "preserve_structure": True,
-    "compress_mode": "files",   # "files" or "folder"
-    "zstd_level": 3
+    "compress_mode": "files",   # "files", "folder" or "seekable"
+    "zstd_level": 3,
+    "auto_dict": True           # train a dictionary on the first files-mode store with many small logs
 }
+# already-compressed formats: stored as-is (".raw") instead of burning zstd time
+INCOMPRESSIBLE_EXT = {".gz", ".zst", ".xz", ".bz2", ".png", ".jpg", ".jpeg", ".mp4", ".zip"}
+_BUF = 256 * 1024       # streaming chunk size for per-file (de)compression
+ONESHOT_MAX = 64 << 20  # files up to this size are read and compressed in one call
+STORED_BLOCK = 128 * 1024   # max zstd block size; raw blocks of stored-only frames
+AUTO_DICT_MIN_FILES = 100   # small (<= 64 KiB) files needed before auto-training a dictionary
+LONG_WINDOW_LOG = 27   # folder-mode tars match across files like `zstd --long=27`; this is
+                       # also libzstd's default decoder window limit, so dump needs no opt-in
+TOMBSTONE_LIMIT = 64   # deleted commits tolerated in index.jsonl before it is compacted
+STALE_LIMIT = 256      # dead lines (superseded or deleted) tolerated before load_index compacts
 
 # ---------- helpers ----------
 def human_size(nbytes):
@@ -70,7 +92,7 @@ def get_paths(root):
     rack_dir = os.path.join(root, ".rack")
     config_file = os.path.join(rack_dir, "rack.json")
     store_dir = os.path.join(rack_dir, "store")
-    index_file = os.path.join(store_dir, "index.json")
+    index_file = os.path.join(store_dir, "index.jsonl")
     return rack_dir, config_file, store_dir, index_file
 
 def init_project():
@@ -82,45 +104,375 @@ def init_project():
     os.makedirs(rack_dir, exist_ok=True)
     os.makedirs(store_dir, exist_ok=True)
 
-    with open(config_file, "w") as f:
-        json.dump(DEFAULT_CONFIG, f, indent=2)
-    with open(index_file, "w") as f:
-        json.dump({}, f, indent=2)
+    with open(config_file, "wb") as f:
+        f.write(json_dumps(DEFAULT_CONFIG, pretty=True))
+    open(index_file, "w").close()
 
     print("📦 Initialized empty rack project in .rack/")
 
+def json_loads(data):
+    return orjson.loads(data) if orjson else json.loads(data)
+
+def json_dumps(obj, pretty=False):
+    """JSON as bytes (orjson when installed, stdlib otherwise); compact unless pretty."""
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if pretty else None)
+    return json.dumps(obj, indent=2 if pretty else None).encode()
+
 def load_config(root):
     _, config_file, _, _ = get_paths(root)
-    with open(config_file) as f:
-        return json.load(f)
+    with open(config_file, "rb") as f:
+        return json_loads(f.read())
+
+# index.jsonl is an append-only log of {hash: entry} lines (last line wins);
+# deleted hashes go to a .tombstone sidecar until enough pile up to compact.
+def load_tombstones(index_file):
+    try:
+        with open(index_file + ".tombstone", "rb") as f:
+            return set(json_loads(f.read()))
+    except FileNotFoundError:
+        return set()
+
+def save_tombstones(index_file, tombstones):
+    with open(index_file + ".tombstone", "wb") as f:
+        f.write(json_dumps(sorted(tombstones)))
 
 def load_index(root):
-    _, _, _, index_file = get_paths(root)
-    with open(index_file) as f:
-        return json.load(f)
+    _, _, store_dir, index_file = get_paths(root)
+    legacy_file = os.path.join(store_dir, "index.json")
+    if not os.path.exists(index_file) and os.path.isfile(legacy_file):
+        with open(legacy_file, "rb") as f:
+            index = json_loads(f.read())
+        save_index(root, index)
+        os.remove(legacy_file)
+        return index
+    index = {}
+    lines = 0
+    with open(index_file, "rb") as f:
+        for line in f:
+            if line.strip():
+                index.update(json_loads(line))
+                lines += 1
+    for h in load_tombstones(index_file):
+        index.pop(h, None)
+    # tag updates append without tombstoning, so also compact on dead-line count
+    if lines - len(index) > STALE_LIMIT:
+        try:
+            save_index(root, index)
+        except OSError:
+            pass  # read-only store: compaction can wait
+    return index
 
 def save_index(root, index):
+    """Rewrite (compact) the whole index log and drop its tombstones."""
+    _, _, _, index_file = get_paths(root)
+    with open(index_file + ".tmp", "wb") as f:
+        for h, entry in index.items():
+            f.write(json_dumps({h: entry}) + b"\n")
+    os.replace(index_file + ".tmp", index_file)
+    if os.path.exists(index_file + ".tombstone"):
+        os.remove(index_file + ".tombstone")
+
+def append_commit(root, h, entry):
     _, _, _, index_file = get_paths(root)
-    with open(index_file, "w") as f:
-        json.dump(index, f, indent=2)
+    with open(index_file, "ab") as f:
+        f.write(json_dumps({h: entry}) + b"\n")
+    tombstones = load_tombstones(index_file)
+    if h in tombstones:  # re-stored after a delete
+        tombstones.discard(h)
+        save_tombstones(index_file, tombstones)
+
+def delete_commits(root, hashes, index=None):
+    """Tombstone hashes; `index` is the caller's already-updated view, used if we compact."""
+    _, _, _, index_file = get_paths(root)
+    tombstones = load_tombstones(index_file) | set(hashes)
+    if len(tombstones) > TOMBSTONE_LIMIT:
+        if index is None:
+            index = load_index(root)
+            for h in hashes:
+                index.pop(h, None)
+        save_index(root, index)
+    else:
+        save_tombstones(index_file, tombstones)
+
+# each commit dir also carries its entry as meta.json, so single-commit
+# lookups (info, dump) don't have to replay the whole index
+def write_meta(commit_dir, entry):
+    if os.path.isdir(commit_dir):
+        with open(os.path.join(commit_dir, "meta.json"), "wb") as f:
+            f.write(json_dumps(entry))
+
+def load_entry(root, commit_hash):
+    """Index entry for one commit, or None if it isn't stored."""
+    _, _, store_dir, _ = get_paths(root)
+    try:
+        with open(os.path.join(store_dir, commit_hash, "meta.json"), "rb") as f:
+            return json_loads(f.read())
+    except FileNotFoundError:
+        return load_index(root).get(commit_hash)
+
+def build_tag_index(index):
+    """tag key -> lowercased value -> set of hashes."""
+    tag_idx = {}
+    for h, data in index.items():
+        for k, v in data.get("tags", {}).items():
+            tag_idx.setdefault(k, {}).setdefault(str(v).lower(), set()).add(h)
+    return tag_idx
+
+def load_search_index(root):
+    """Index plus its tag map, cached in a JSON sidecar keyed on the index files' stat."""
+    _, _, store_dir, index_file = get_paths(root)
+    cache_file = os.path.join(store_dir, "search.cache")
+
+    def cache_key():
+        return [[st.st_mtime_ns, st.st_size] for st in
+                (os.stat(p) for p in (index_file, index_file + ".tombstone") if os.path.exists(p))]
+    try:
+        with open(cache_file, "rb") as f:
+            cached = json_loads(f.read())
+        if cached["key"] == cache_key():
+            tag_idx = {k: {v: set(hs) for v, hs in by_value.items()} for k, by_value in cached["tags"].items()}
+            return cached["index"], tag_idx
+    except Exception:
+        pass  # missing or stale/corrupt cache: rebuild
+
+    index = load_index(root)
+    tag_idx = build_tag_index(index)
+    tags = {k: {v: sorted(hs) for v, hs in by_value.items()} for k, by_value in tag_idx.items()}
+    try:
+        with open(cache_file, "wb") as f:
+            f.write(json_dumps({"key": cache_key(), "index": index, "tags": tags}))
+    except OSError:
+        pass  # read-only store: search still works, just uncached
+    return index, tag_idx
+
+def dict_path(root, dict_id=None):
+    """Active trained dictionary, or the archived copy for a given dict_id."""
+    _, _, store_dir, _ = get_paths(root)
+    if dict_id is None:
+        return os.path.join(store_dir, "dict.zstd")
+    return os.path.join(store_dir, "dicts", f"{dict_id}.zstd")
+
+def load_dict(path):
+    with open(path, "rb") as f:
+        return zstd.ZstdCompressionDict(f.read())
+
+def commit_dict(root, dict_id):
+    """Dict a commit was compressed with: its archived copy, else the active dict if the id matches."""
+    if not dict_id:
+        return None
+    path = dict_path(root, dict_id)
+    if os.path.isfile(path):
+        return load_dict(path)
+    if os.path.isfile(dict_path(root)):
+        zdict = load_dict(dict_path(root))
+        if zdict.dict_id() == dict_id:
+            return zdict
+    sys.exit(f"❌ Error: dictionary {dict_id} needed by this commit is missing")
 
 def hash_commit(msg, tags):
+    # content id only (collisions are checked explicitly), so no need for sha256.
+    # Fed incrementally; digests equal hashing "msg|k1=v1|k2=v2" (or "msg|" untagged).
+    h = hashlib.blake2b(msg.encode(), digest_size=6)
+    if not tags:
+        h.update(b"|")
+    for k in sorted(tags):
+        h.update(b"|"); h.update(k.encode()); h.update(b"="); h.update(str(tags[k]).encode())
+    return h.hexdigest()
+
+def legacy_hash_commit(msg, tags):
+    """sha256-derived id of stores made before hash_commit switched to blake2b."""
     key = msg + "|" + "|".join(f"{k}={v}" for k, v in sorted(tags.items()))
     return hashlib.sha256(key.encode()).hexdigest()[:12]
 
-def compress_file(src, dst, level):
-    cctx = zstd.ZstdCompressor(level=level)
+_tls = threading.local()
+
+def _cctx(level, zdict=None, threads=-1):
+    """One ZstdCompressor per thread, level, dict and libzstd thread count, reused across files."""
+    cache = _tls.__dict__.setdefault("cctx", {})
+    if (level, zdict, threads) not in cache:
+        cache[level, zdict, threads] = zstd.ZstdCompressor(level=level, dict_data=zdict, threads=threads)
+    return cache[level, zdict, threads]
+
+def _dctx(zdict=None):
+    """One ZstdDecompressor per thread and dict, since instances aren't thread-safe."""
+    cache = _tls.__dict__.setdefault("dctx", {})
+    if zdict not in cache:
+        cache[zdict] = zstd.ZstdDecompressor(dict_data=zdict)
+    return cache[zdict]
+
+def compress_stream(fsrc, fdst, cctx, h=None):
+    """Write all of fsrc to fdst as a single zstd frame, feeding the same bytes to hasher h."""
+    size = os.fstat(fsrc.fileno()).st_size
+    if size <= ONESHOT_MAX:
+        # one-shot from memory: a single compress call that records the content size.
+        # Not mmap: a log truncated mid-compress (copytruncate, O_TRUNC) would SIGBUS.
+        data = fsrc.read()
+        if h:
+            h.update(data)
+        fdst.write(cctx.compress(data))
+    elif h is None:
+        cctx.copy_stream(fsrc, fdst, size=size, read_size=_BUF, write_size=_BUF)
+    else:
+        with cctx.stream_writer(fdst, size=size, write_size=_BUF, closefd=False) as zw:
+            for chunk in iter(lambda: fsrc.read(_BUF), b""):
+                h.update(chunk)
+                zw.write(chunk)
+
+def write_stored_frame(fsrc, fdst):
+    """Copy fsrc into fdst as one zstd frame of raw (uncompressed) blocks.
+
+    For already-compressed members of a seekable archive: no compression work, but
+    still a standard frame, so the archive stays plain concatenated zstd.
+    """
+    size = os.fstat(fsrc.fileno()).st_size
+    # magic, descriptor (8-byte content size, no checksum/dict), 128 KiB window, content size
+    fdst.write(b"\x28\xb5\x2f\xfd\xc0" + bytes([(17 - 10) << 3]) + size.to_bytes(8, "little"))
+    remaining = size
+    while True:
+        n = min(STORED_BLOCK, remaining)
+        data = fsrc.read(n)
+        if len(data) != n:
+            raise OSError(f"{fsrc.name} shrank while being stored")
+        remaining -= n
+        # block header: last-block bit, type 0 (raw), size; the header says size, so
+        # a log growing meanwhile is cut at its size from fstat()
+        fdst.write(((n << 3) | (remaining == 0)).to_bytes(3, "little"))
+        fdst.write(data)
+        if remaining == 0:
+            return
+
+def decompress_stream(fsrc, fdst, length, dctx):
+    """Decompress the frame at fsrc's position (`length` compressed bytes) into fdst."""
+    # the frame header (<= 18 bytes) says whether the frame records its content size
+    header = fsrc.read(min(18, length))
+    fsrc.seek(-len(header), os.SEEK_CUR)
+    size = zstd.get_frame_parameters(header).content_size if header else zstd.CONTENTSIZE_UNKNOWN
+    if length <= ONESHOT_MAX and size <= ONESHOT_MAX:
+        fdst.write(dctx.decompress(fsrc.read(length)))
+        return
+    # feed exactly `length` bytes so a frame inside an archive never runs into the next one
+    dobj = dctx.decompressobj(write_size=_BUF)
+    while length > 0:
+        chunk = fsrc.read(min(_BUF, length))
+        if not chunk:
+            break
+        length -= len(chunk)
+        fdst.write(dobj.decompress(chunk))
+
+def compress_file(src, dst, level, zdict=None, threads=-1):
     with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
-        with cctx.stream_writer(fdst) as compressor:
-            shutil.copyfileobj(fsrc, compressor, length=1024*1024)  # 1MB chunks
+        compress_stream(fsrc, fdst, _cctx(level, zdict, threads))
 
-def decompress_file(src, dst):
-    dctx = zstd.ZstdDecompressor()
+def decompress_file(src, dst, zdict=None):
     with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
-        with dctx.stream_reader(fsrc) as reader:
-            shutil.copyfileobj(reader, fdst, length=1024*1024)
+        decompress_stream(fsrc, fdst, os.fstat(fsrc.fileno()).st_size, _dctx(zdict))
+
+def decompress_frame(archive, offset, length, dst, zdict=None):
+    """Extract one member of a seekable archive: seek to its frame, decompress only that."""
+    with open(archive, "rb") as fsrc, open(dst, "wb") as fdst:
+        fsrc.seek(offset)
+        decompress_stream(fsrc, fdst, length, _dctx(zdict))
+
+def copy_raw(src, dst):
+    """In-kernel copy: copy_file_range where available (may reflink), else shutil.copyfile (sendfile)."""
+    if hasattr(os, "copy_file_range"):
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            try:
+                while os.copy_file_range(fsrc.fileno(), fdst.fileno(), 1 << 30):
+                    pass
+                return
+            except OSError:
+                pass  # unsupported fs / cross-device on older kernels
+    shutil.copyfile(src, dst)
+
+def file_digest(path, salt=b""):
+    h = hashlib.blake2b(salt, digest_size=8)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _compress_one(task):
+    """Worker for the store() thread pool: make sure src's object exists in the pool.
+
+    Objects are keyed by content, salted with the zstd level and dict id (an object
+    is only reused if it was compressed the same way, and a dict-compressed object
+    needs that dict back), so unchanged files are compressed only once. Raw objects
+    are plain copies. A new object is named after the bytes actually written, so a
+    live log changing mid-store can't end up under another content's name.
+    Returns (object name, object size).
+    """
+    src, objects_dir, level, zdict, raw = task
+    suffix = ".raw" if raw else ".zst"
+    salt = b"" if raw else f"{level}:{zdict.dict_id() if zdict else ''}:".encode()
+    tmp = os.path.join(objects_dir, f".{os.getpid()}.{threading.get_ident()}.tmp")
+    cctx = _cctx(level, zdict, threads=0)  # the pool already runs one file per core
+    with open(src, "rb") as fsrc:
+        data = None
+        if not raw and os.fstat(fsrc.fileno()).st_size <= ONESHOT_MAX:
+            data = fsrc.read()  # one read feeds both the object key and the compressor
+            h = hashlib.blake2b(salt, digest_size=8); h.update(data)
+            digest = h.hexdigest()
+        else:
+            digest = file_digest(src, salt)  # cheap check before copying/compressing
+        obj = os.path.join(objects_dir, digest + suffix)
+        if os.path.exists(obj):
+            return digest + suffix, os.path.getsize(obj)
+        if raw:
+            copy_raw(src, tmp)
+            digest = file_digest(tmp)
+        elif data is not None:
+            with open(tmp, "wb") as fdst:
+                fdst.write(cctx.compress(data))
+        else:
+            h = hashlib.blake2b(salt, digest_size=8)
+            with open(tmp, "wb") as fdst:
+                compress_stream(fsrc, fdst, cctx, h)
+            digest = h.hexdigest()
+    obj = os.path.join(objects_dir, digest + suffix)
+    os.replace(tmp, obj)  # atomic, so racing workers with equal content are harmless
+    return digest + suffix, os.path.getsize(obj)
+
+def makedirs_once(path, created):
+    """os.makedirs, but each directory (and its ancestors) is only touched once per run."""
+    if path in created:
+        return
+    os.makedirs(path, exist_ok=True)
+    while path not in created:
+        created.add(path)
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+
+def link_object(obj, dst):
+    """Hardlink a pool object into a commit dir (copy if the fs can't link)."""
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(obj, dst)
+    except OSError:
+        shutil.copyfile(obj, dst)
+
+def prune_objects(store_dir):
+    """Drop pool objects no commit links to anymore."""
+    objects_dir = os.path.join(store_dir, "objects")
+    if not os.path.isdir(objects_dir):
+        return
+    with os.scandir(objects_dir) as it:
+        for e in it:
+            if e.stat(follow_symlinks=False).st_nlink <= 1:
+                os.remove(e.path)
+
+_last_draw = [0.0, -1]  # monotonic time and cur of the last redraw
 
 def status_bar(cur, total, prefix=""):
+    # redraw only once cur moves >=1% or 50 ms pass; the final frame always draws
+    now = time.monotonic()
+    if cur != total and abs(cur - _last_draw[1]) < max(1, total // 100) and now - _last_draw[0] < 0.05:
+        return
+    _last_draw[:] = [now, cur]
     width = 30
     if total == 0:
         bar = "-" * width
@@ -134,14 +486,60 @@ def status_bar(cur, total, prefix=""):
         print()
 
 # ---------- core commands ----------
+_last_poll = [0.0]  # monotonic time of the last stdin poll
+
 def check_abort():
     """Return True if user pressed 'q' (kill switch)."""
+    # select() at most every 50 ms: bounds syscalls on many tiny files, stays responsive on big ones
+    now = time.monotonic()
+    if now - _last_poll[0] < 0.05:
+        return False
+    _last_poll[0] = now
     if sys.stdin in select.select([sys.stdin], [], [], 0)[0]:
         ch=sys.stdin.read(1)
         if ch.lower()=="q": return True
     return False
 
 # ---------- core ----------
+def walk_files(root):
+    """Yield (path, relpath, filename, DirEntry) for files under root; DirEntry caches its stat()."""
+    stack=[(root,"")]  # explicit stack: no recursion limit on deep trees
+    while stack:
+        d,prefix=stack.pop()
+        try: it=os.scandir(d)
+        except OSError: continue  # unreadable dir: skip it, as os.walk does
+        with it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False): stack.append((e.path,prefix+e.name+"/"))
+                elif e.is_file(): yield e.path,prefix+e.name,e.name,e
+
+def add_tar_member(tar,src,arc,st):
+    """Add a regular file from an already-taken stat, skipping tar.add's lstat/pwd lookups.
+
+    Member data is copied by tarfile in userspace on purpose: the tar's sink is the
+    zstd stream_writer, not a file descriptor, so sendfile/copy_file_range can't apply.
+    """
+    ti=tarfile.TarInfo(arc)
+    ti.size=st.st_size; ti.mtime=int(st.st_mtime); ti.mode=stat.S_IMODE(st.st_mode)
+    ti.uid=st.st_uid; ti.gid=st.st_gid
+    with open(src,"rb") as f:
+        try:
+            tar.addfile(ti,f)
+        except ValueError:  # name too long for ustar: this one member gets a pax header
+            tar.format=tarfile.PAX_FORMAT
+            try: tar.addfile(ti,f)
+            finally: tar.format=tarfile.USTAR_FORMAT
+
+@functools.lru_cache(maxsize=None)
+def glob_regex(patterns):
+    """One combined regex for a tuple of globs (instead of an fnmatch call per pattern per file)."""
+    return re.compile("(?:"+")|(?:".join(fnmatch.translate(p) for p in patterns)+")") if patterns else None
+
+def gather_files(logs_dir,cfg):
+    """Return walk_files() tuples under logs_dir, minus config excludes."""
+    excl_re=glob_regex(tuple(cfg.get("exclude",[])))
+    return [f for f in walk_files(logs_dir) if not (excl_re and excl_re.match(f[1]))]
+
 def store(msg,tags,override_path=None,remove=False):
     root=require_rack_root()
     _,_,store_dir,_=get_paths(root)
@@ -151,54 +549,96 @@ def store(msg,tags,override_path=None,remove=False):
 
     index=load_index(root)
     h=hash_commit(msg,tags)
-    if h in index: sys.exit(f"❌ Error: duplicate commit detected {h}")
+    for known in (h,legacy_hash_commit(msg,tags)):  # older stores are keyed by their sha256 id
+        if known in index: sys.exit(f"❌ Error: duplicate commit detected {known}")
 
     tmp_commit_dir=os.path.join(store_dir,"_"+h)
     final_commit_dir=os.path.join(store_dir,h)
     if os.path.exists(tmp_commit_dir) or os.path.exists(final_commit_dir):
         sys.exit(f"❌ Error: commit directory for {h} already exists")
 
-    os.makedirs(tmp_commit_dir,exist_ok=True)
+    files=gather_files(logs_dir,cfg)
 
-    files=[]; 
-    for wr,_,fns in os.walk(logs_dir):
-        for fn in fns:
-            rel=os.path.relpath(os.path.join(wr,fn),logs_dir)
-            if any(fnmatch.fnmatch(rel,pat) for pat in cfg.get("exclude",[])): continue
-            files.append((wr,fn))
+    os.makedirs(tmp_commit_dir,exist_ok=True)
 
-    total_size=0; count=len(files)
+    total_size=0; count=len(files); dict_id=None
+    lvl=cfg.get("zstd_level",3)
     try:
         if cfg.get("compress_mode","files")=="folder":
-            tar_path=os.path.join(tmp_commit_dir,"logs.tar")
-            with tarfile.open(tar_path,"w") as tar:
-                for i,(wr,fn) in enumerate(files,1):
+            tar_zst=os.path.join(tmp_commit_dir,"logs.tar.zst")
+            # one tar of many similar logs: long-distance matching over a 128 MiB window
+            params=zstd.ZstdCompressionParameters.from_level(lvl,window_log=LONG_WINDOW_LOG,enable_ldm=True,
+                                                             threads=-1,write_checksum=True)
+            cctx=zstd.ZstdCompressor(compression_params=params)
+            # tar streams straight into zstd ("w|" never seeks), no intermediate logs.tar
+            with open(tar_zst,"wb") as fdst, cctx.stream_writer(fdst,write_size=1<<20) as zw, tarfile.open(fileobj=zw,mode="w|",copybufsize=1<<20,format=tarfile.USTAR_FORMAT) as tar:
+                for i,(src,rel,fn,e) in enumerate(files,1):
                     if check_abort(): raise KeyboardInterrupt
-                    rel=os.path.relpath(os.path.join(wr,fn),logs_dir)
                     arc=rel if cfg.get("preserve_structure",True) else fn
-                    tar.add(os.path.join(wr,fn),arcname=arc)
+                    add_tar_member(tar,src,arc,e.stat())
                     status_bar(i,count,prefix="📦 Packing")
-            # compress tar
-            lvl=cfg.get("zstd_level",3)
-            with open(tar_path,"rb") as fsrc, open(tar_path+".zst","wb") as fdst:
-                fdst.write(zstd.ZstdCompressor(level=lvl).compress(fsrc.read()))
-            total_size=os.path.getsize(tar_path+".zst"); os.remove(tar_path)
+            total_size=os.path.getsize(tar_zst)
+        elif cfg.get("compress_mode","files")=="seekable":
+            # logs.szst: one independent frame per file, located via the logs.szst.json member index
+            szst=os.path.join(tmp_commit_dir,"logs.szst")
+            zdict=load_dict(dict_path(root)) if os.path.isfile(dict_path(root)) else None
+            if zdict: dict_id=zdict.dict_id()
+            cctx=_cctx(lvl,zdict); members={}
+            with open(szst,"wb") as fdst:
+                for i,(src,rel,fn,_) in enumerate(files,1):
+                    if check_abort(): raise KeyboardInterrupt
+                    arc=rel if cfg.get("preserve_structure",True) else fn
+                    off=fdst.tell()
+                    with open(src,"rb") as fsrc:
+                        if os.path.splitext(fn)[1].lower() in INCOMPRESSIBLE_EXT: write_stored_frame(fsrc,fdst)
+                        else: compress_stream(fsrc,fdst,cctx)
+                    members[arc]=[off,fdst.tell()-off]
+                    status_bar(i,count,prefix="📦 Compressing")
+                total_size=fdst.tell()
+            with open(szst+".json","wb") as f: f.write(json_dumps(members))
         else: # files
-            lvl=cfg.get("zstd_level",3)
-            for i,(wr,fn) in enumerate(files,1):
-                if check_abort(): raise KeyboardInterrupt
-                rel=os.path.relpath(os.path.join(wr,fn),logs_dir)
-                dst=os.path.join(tmp_commit_dir,rel+".zst") if cfg.get("preserve_structure",True) else os.path.join(tmp_commit_dir,fn+".zst")
-                os.makedirs(os.path.dirname(dst),exist_ok=True)
-                compress_file(os.path.join(wr,fn),dst,lvl)
-                total_size+=os.path.getsize(dst)
-                status_bar(i,count,prefix="📦 Compressing")
-
-        now=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            if cfg.get("auto_dict",True) and not os.path.isfile(dict_path(root)):
+                small=[f for f in files if f[3].stat().st_size<=64*1024]
+                if len(small)>=AUTO_DICT_MIN_FILES:
+                    try:
+                        zdict,n=train_from_files(root,small)
+                        print(f"🧠 Trained dictionary {zdict.dict_id()} from {n} small files")
+                    except zstd.ZstdError: pass  # not enough signal; store without a dict
+            zdict=load_dict(dict_path(root)) if os.path.isfile(dict_path(root)) else None
+            if zdict: dict_id=zdict.dict_id()
+            objects_dir=os.path.join(store_dir,"objects"); os.makedirs(objects_dir,exist_ok=True)
+            tasks=[]; dsts=[]; manifest={}; created=set()
+            # largest first (LPT scheduling) so one big log doesn't straggle at the end
+            files.sort(key=lambda f: -f[3].stat().st_size)
+            for src,rel,fn,_ in files:
+                raw=os.path.splitext(fn)[1].lower() in INCOMPRESSIBLE_EXT
+                suffix=".raw" if raw else ".zst"
+                dst=os.path.join(tmp_commit_dir,rel+suffix) if cfg.get("preserve_structure",True) else os.path.join(tmp_commit_dir,fn+suffix)
+                makedirs_once(os.path.dirname(dst),created)
+                tasks.append((src,objects_dir,lvl,zdict,raw)); dsts.append(dst)
+            # libzstd and blake2b release the GIL on large buffers, so threads parallelize
+            # without process startup or pickling; compressors are per-thread (see _cctx)
+            with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+                futs={ex.submit(_compress_one,t):dst for t,dst in zip(tasks,dsts)}
+                try:
+                    for i,fut in enumerate(as_completed(futs),1):
+                        if check_abort(): raise KeyboardInterrupt
+                        (obj,sz),dst=fut.result(),futs[fut]
+                        link_object(os.path.join(objects_dir,obj),dst)
+                        manifest[os.path.relpath(dst,tmp_commit_dir)]=obj
+                        total_size+=sz
+                        status_bar(i,count,prefix="📦 Compressing")
+                except BaseException:  # q or Ctrl-C: drop queued files instead of finishing them
+                    ex.shutdown(wait=False,cancel_futures=True); raise
+            with open(os.path.join(tmp_commit_dir,"manifest.json"),"wb") as f: f.write(json_dumps(manifest))
+
+        now=time.strftime("%Y-%m-%d %H:%M:%S")
         rel_input=os.path.relpath(logs_dir,root)
         index[h]={"msg":msg,"date":now,"size_bytes":total_size,"files":count,
                   "path":os.path.relpath(final_commit_dir,root),"input_dir":rel_input,"tags":tags}
-        save_index(root,index)
+        if dict_id: index[h]["dict_id"]=dict_id
+        write_meta(tmp_commit_dir,index[h])
+        append_commit(root,h,index[h])
 
         shutil.move(tmp_commit_dir,final_commit_dir)
         tags_str=", ".join(f"{k}={v}" for k,v in tags.items())
@@ -210,54 +650,90 @@ def store(msg,tags,override_path=None,remove=False):
                 shutil.rmtree(fp) if os.path.isdir(fp) else os.remove(fp)
             print(f"🗑️ Cleared contents of {logs_dir}")
     except KeyboardInterrupt:
-        shutil.rmtree(tmp_commit_dir,ignore_errors=True)
+        shutil.rmtree(tmp_commit_dir,ignore_errors=True); prune_objects(store_dir)
         print("\n❌ Aborted by user (q pressed). Cleaned up temp data.")
     except Exception as e:
-        shutil.rmtree(tmp_commit_dir,ignore_errors=True)
+        shutil.rmtree(tmp_commit_dir,ignore_errors=True); prune_objects(store_dir)
         raise e
 
-def dump(commit_hash,outdir=None,remove=False):
+def dump(commit_hash,outdir=None,remove=False,patterns=None):
+    """Extract a commit, or only its files whose stored path matches one of the globs in patterns."""
     root=require_rack_root(); _,_,store_dir,_=get_paths(root)
-    cfg=load_config(root); index=load_index(root)
-    if commit_hash not in index: sys.exit(f"❌ Error: commit {commit_hash} not found")
+    if patterns and remove: sys.exit("❌ Error: -rm can't be combined with a file filter")
+    want=glob_regex(tuple(patterns)) if patterns else None
+    cfg=load_config(root); entry=load_entry(root,commit_hash)
+    if entry is None: sys.exit(f"❌ Error: commit {commit_hash} not found")
     commit_dir=os.path.join(store_dir,commit_hash)
     if not os.path.isdir(commit_dir): sys.exit(f"❌ Error: commit dir missing {commit_hash}")
 
-    outdir=outdir or os.path.join(root,index[commit_hash].get("input_dir",cfg.get("input_dir")))
+    outdir=outdir or os.path.join(root,entry.get("input_dir",cfg.get("input_dir")))
     outdir=os.path.abspath(outdir); os.makedirs(outdir,exist_ok=True)
 
     files_extracted=[]
     try:
         tar_zst=os.path.join(commit_dir,"logs.tar.zst")
         if os.path.isfile(tar_zst):
-            with tempfile.NamedTemporaryFile(delete=False) as tmp: tmp_tar=tmp.name
-            with open(tar_zst,"rb") as fsrc, open(tmp_tar,"wb") as fdst:
-                fdst.write(zstd.ZstdDecompressor().decompress(fsrc.read()))
-            with tarfile.open(tmp_tar,"r") as tar:
-                members=[m for m in tar.getmembers() if m.isreg() or m.isdir()]
-                total=len(members)
-                for i,m in enumerate(members,1):
+            # single forward pass: zstd stream -> "r|" tar, no temp tar on disk
+            total=entry.get("files",0)
+            with open(tar_zst,"rb") as fsrc, _dctx().stream_reader(fsrc,read_size=_BUF) as sr, tarfile.open(fileobj=sr,mode="r|",copybufsize=1<<20) as tar:
+                for m in tar:
+                    tar.members=[]  # "r|" never looks back, so don't accumulate every header
+                    if not (m.isreg() or m.isdir()): continue
+                    if want and not (m.isreg() and want.match(m.name)): continue  # "r|" still reads past it
                     if check_abort(): raise KeyboardInterrupt
                     tar.extract(m,path=outdir)
-                    if m.isreg(): files_extracted.append(m.name)
-                    status_bar(i,total,prefix="📤 Extracting")
-            os.remove(tmp_tar)
+                    if m.isreg():
+                        files_extracted.append(m.name)
+                        status_bar(len(files_extracted),max(total,len(files_extracted)),prefix="📤 Extracting")
+            if 0<len(files_extracted)<total: print()  # a filtered dump never fills the bar
+        elif os.path.isfile(os.path.join(commit_dir,"logs.szst")):
+            szst=os.path.join(commit_dir,"logs.szst")
+            with open(szst+".json","rb") as f: members=json_loads(f.read())
+            # random access: only the selected members' frames are read
+            if want: members={rel:v for rel,v in members.items() if want.match(rel)}
+            zdict=commit_dict(root,entry.get("dict_id"))
+            total=len(members); created=set()
+            for rel in members: makedirs_once(os.path.dirname(os.path.join(outdir,rel)),created)
+            # frames are independent, so members decompress in parallel straight from their offsets
+            with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+                futs={ex.submit(decompress_frame,szst,off,length,os.path.join(outdir,rel),zdict):rel
+                      for rel,(off,length) in members.items()}
+                try:
+                    for i,fut in enumerate(as_completed(futs),1):
+                        if check_abort(): raise KeyboardInterrupt
+                        fut.result(); files_extracted.append(futs[fut])
+                        status_bar(i,total,prefix="📤 Extracting")
+                except BaseException:  # q or Ctrl-C: drop queued files instead of finishing them
+                    ex.shutdown(wait=False,cancel_futures=True); raise
         else:
-            zst_files=[]
-            for wr,_,fns in os.walk(commit_dir):
-                for fn in fns:
-                    if fn.endswith(".zst"): zst_files.append(os.path.join(wr,fn))
+            manifest_file=os.path.join(commit_dir,"manifest.json")
+            if os.path.isfile(manifest_file):  # lists the stored files, no walk needed
+                with open(manifest_file,"rb") as f: zst_files=list(json_loads(f.read()))
+            else:
+                zst_files=[rel for _,rel,fn,_ in walk_files(commit_dir) if fn.endswith((".zst",".raw"))]
+            if want: zst_files=[stored for stored in zst_files if want.match(stored[:-4])]
             total=len(zst_files)
-            for i,src in enumerate(zst_files,1):
-                if check_abort(): raise KeyboardInterrupt
-                rel=os.path.relpath(src,commit_dir)[:-4]
-                dst=os.path.join(outdir,rel); os.makedirs(os.path.dirname(dst),exist_ok=True)
-                decompress_file(src,dst); files_extracted.append(rel)
-                status_bar(i,total,prefix="📤 Extracting")
+            zdict=commit_dict(root,entry.get("dict_id"))
+            jobs=[]; created=set()
+            for stored in zst_files:
+                src=os.path.join(commit_dir,stored); rel=stored[:-4]  # strip ".zst" / ".raw"
+                dst=os.path.join(outdir,rel); makedirs_once(os.path.dirname(dst),created)
+                jobs.append((src,dst,rel))
+            # libzstd releases the GIL while decompressing, so threads are enough here
+            with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+                futs={(ex.submit(decompress_file,src,dst,zdict) if src.endswith(".zst") else ex.submit(copy_raw,src,dst)):rel
+                      for src,dst,rel in jobs}
+                try:
+                    for i,fut in enumerate(as_completed(futs),1):
+                        if check_abort(): raise KeyboardInterrupt
+                        fut.result(); files_extracted.append(futs[fut])
+                        status_bar(i,total,prefix="📤 Extracting")
+                except BaseException:  # q or Ctrl-C: drop queued files instead of finishing them
+                    ex.shutdown(wait=False,cancel_futures=True); raise
 
         print(f"✅ Dumped {len(files_extracted)} files into {outdir}")
         if remove:
-            shutil.rmtree(commit_dir); index.pop(commit_hash,None); save_index(root,index)
+            shutil.rmtree(commit_dir); prune_objects(store_dir); delete_commits(root,[commit_hash])
             print(f"🗑️ Removed stored commit {commit_hash}")
     except KeyboardInterrupt:
         print("\n❌ Aborted by user (q pressed). Partial dump may exist in", outdir)
@@ -287,10 +763,9 @@ def list_commits(sort_field=None, desc=False):
 
 def info(commit_hash):
     root = require_rack_root()
-    index = load_index(root)
-    if commit_hash not in index:
+    data = load_entry(root, commit_hash)
+    if data is None:
         sys.exit(f"❌ Error: store {commit_hash} not found.")
-    data = index[commit_hash]
     print(f"ℹ️  Store: {commit_hash}")
     print(f"   📅 Date: {data.get('date')}")
     print(f"   📝 Message: {data.get('msg')}")
@@ -303,21 +778,25 @@ def info(commit_hash):
 
 def search(filters):
     root = require_rack_root()
-    index = load_index(root)
+    index, tag_idx = load_search_index(root)
+    hits = None
+    for k, v in filters.items():
+        if k == "msg":
+            continue
+        by_value = tag_idx.get(k, {})
+        matched = set(by_value.get(str(v).lower(), ()))
+        if str(v) == "":  # an empty value also matches stores without that tag
+            matched |= index.keys() - set().union(*by_value.values())
+        hits = matched if hits is None else hits & matched
+        if not hits:
+            break
     results = []
     for h, data in index.items():
-        ok = True
-        for k, v in filters.items():
-            if k == "msg":
-                if v.lower() not in (data.get("msg") or "").lower():
-                    ok = False
-                    break
-            else:
-                if str(data.get("tags", {}).get(k, "")).lower() != str(v).lower():
-                    ok = False
-                    break
-        if ok:
-            results.append((h, data))
+        if hits is not None and h not in hits:
+            continue
+        if "msg" in filters and filters["msg"].lower() not in (data.get("msg") or "").lower():
+            continue
+        results.append((h, data))
     if not results:
         sys.exit("❌ Error: no matching stores found.")
     for h, data in results:
@@ -334,15 +813,21 @@ def add_tags(commit_hash, new_tags):
     old_entry = index[commit_hash]
     merged = {**old_entry.get("tags", {}), **new_tags}
     new_hash = hash_commit(old_entry["msg"], merged)
+    legacy_hash = legacy_hash_commit(old_entry["msg"], merged)
+    # a pre-blake2b store whose msg/tags are unchanged keeps its sha256 id
+    if legacy_hash == commit_hash:
+        new_hash = commit_hash
 
     # collision
-    if new_hash != commit_hash and new_hash in index:
-        sys.exit(f"❌ Error: Adding these tags would create duplicate store ({new_hash}). Aborting.")
+    for known in (new_hash, legacy_hash):
+        if known != commit_hash and known in index:
+            sys.exit(f"❌ Error: Adding these tags would create duplicate store ({known}). Aborting.")
 
     # if hash unchanged: just update tags
     if new_hash == commit_hash:
         index[commit_hash]["tags"].update(new_tags)
-        save_index(root, index)
+        append_commit(root, commit_hash, index[commit_hash])
+        write_meta(os.path.join(store_dir, commit_hash), index[commit_hash])
         print(f"🔖 Tags updated for {commit_hash}: {new_tags}")
         return
 
@@ -361,9 +846,11 @@ def add_tags(commit_hash, new_tags):
     new_entry["tags"] = merged
     new_entry["path"] = os.path.relpath(new_dir, root)
     index[new_hash] = new_entry
+    append_commit(root, new_hash, new_entry)
+    write_meta(new_dir, new_entry)
     # remove old
     del index[commit_hash]
-    save_index(root, index)
+    delete_commits(root, [commit_hash], index)
     print(f"🔖 Tags added and store renamed: {commit_hash} -> {new_hash}")
 
 def burn(hashes=None):
@@ -380,21 +867,63 @@ def burn(hashes=None):
         return
 
     index = load_index(root)
+    deleted = []
     for h in hashes:
         commit_dir = os.path.join(store_dir, h)
-        if os.path.isdir(commit_dir):
-            shutil.rmtree(commit_dir)
+        # only indexed commits: store/ also holds objects/ and dicts/
+        if h in index:
+            shutil.rmtree(commit_dir, ignore_errors=True)
             index.pop(h, None)
+            deleted.append(h)
             print(f"🔥 Deleted {h}")
         else:
             print(f"❌ Not found: {h}")
-    save_index(root, index)
+    if deleted:
+        prune_objects(store_dir)
+        delete_commits(root, deleted, index)
+
+def train_from_files(root, files, dict_size=112_640, max_samples=1000):
+    """Train on a sample of gather_files() tuples and make it the active dict.
+
+    Returns (dict, samples used); raises zstd.ZstdError if training fails.
+    """
+    if len(files) > max_samples:
+        files = random.sample(files, max_samples)
+    samples = []
+    for src, _, _, _ in files:
+        with open(src, "rb") as f:
+            data = f.read(128 * 1024)  # a sample's head is enough for training
+        if data:
+            samples.append(data)
+    zdict = zstd.train_dictionary(dict_size, samples)
+
+    # archive by id so older stores keep decompressing after a retrain
+    archived = dict_path(root, zdict.dict_id())
+    os.makedirs(os.path.dirname(archived), exist_ok=True)
+    for path in (dict_path(root), archived):
+        with open(path, "wb") as f:
+            f.write(zdict.as_bytes())
+    return zdict, len(samples)
+
+def train_dict(override_path=None):
+    root = require_rack_root()
+    cfg = load_config(root)
+    logs_dir = os.path.abspath(override_path) if override_path else os.path.join(root, cfg["input_dir"])
+    if not os.path.isdir(logs_dir):
+        sys.exit(f"❌ Error: input dir not found: {logs_dir}")
+
+    files = gather_files(logs_dir, cfg)
+    try:
+        zdict, n = train_from_files(root, files)
+    except zstd.ZstdError as e:
+        sys.exit(f"❌ Error: dictionary training failed ({len(files)} files): {e}")
+    print(f"🧠 Trained dictionary {zdict.dict_id()} ({human_size(len(zdict))}) from {n} files")
 
 def config_show():
     root = require_rack_root()
     cfg = load_config(root)
     print("⚙️ Current rack config:")
-    print(json.dumps(cfg, indent=2))
+    print(json_dumps(cfg, pretty=True).decode())
 
 # ---------- argument parsing helpers ----------
 def parse_kv(args):
@@ -455,8 +984,9 @@ def print_usage_and_exit():
     print("  rack add <hash> key=value ...")
     print("  rack burn [-h <hash1> [hash2...]]  # no flags deletes entire .rack")
     print("  rack info <hash>")
-    print("  rack dump <hash> [-o <output_path>] [-rm]")
+    print("  rack dump <hash> [path-glob ...] [-o <output_path>] [-rm]")
     print("  rack config")
+    print("  rack train [-p path]")
     sys.exit(1)
 
 # ---------- main ----------
@@ -545,13 +1075,18 @@ def main():
             sys.exit("❌ Error: dump requires a commit hash")
         outdir = parts["opts"].get("o")
         remove = ("rm" in parts["flags"])
-        dump(commit_hash, outdir, remove)
+        dump(commit_hash, outdir, remove, parts["pos"][1:])
         return
 
     if cmd == "config":
         config_show()
         return
 
+    if cmd == "train":
+        parts = extract_flags_and_positionals(sys.argv[2:])
+        train_dict(parts["opts"].get("p"))
+        return
+
     # unknown command
     sys.exit(f"❌ Error: unknown command '{cmd}'\nStart with `rack init`")
 